@@ -0,0 +1,29 @@
+import asyncio
+import httpx
+from openai import AsyncOpenAI
+from config.settings import settings
+
+# One pooled client shared by every agent so concurrent questions reuse
+# keep-alive connections instead of opening a socket per call.
+aclient = AsyncOpenAI(
+    api_key=settings.OPENAI_API_KEY,
+    http_client=httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+        timeout=httpx.Timeout(60.0, connect=5.0)
+    )
+)
+
+# Cap on in-flight completions per model; extra calls wait instead of piling onto the API
+MAX_CONCURRENT_REQUESTS_PER_MODEL = 32
+
+# Like the client's connections, these are bound to the one event loop that uses them
+_semaphores = {}
+
+
+async def create_chat_completion(**kwargs):
+    """Call `aclient.chat.completions.create` under the per-model concurrency limit."""
+    model = kwargs["model"]
+    if model not in _semaphores:
+        _semaphores[model] = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS_PER_MODEL)
+    async with _semaphores[model]:
+        return await aclient.chat.completions.create(**kwargs)
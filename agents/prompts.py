@@ -0,0 +1,43 @@
+from typing import Dict, List, Tuple
+from langchain.schema import Document
+
+# Shared by every agent so requests over the same passages start with an
+# identical prefix, which OpenAI's prompt caching can reuse.
+SYSTEM_PROMPT = (
+    "You are DocChat, an AI assistant that works strictly from the document passages provided. "
+    "Never rely on outside knowledge, and follow the task instructions given after the passages."
+)
+
+
+def build_messages(context: str, instructions: str) -> List[Dict]:
+    """
+    Lay out a chat request as invariant system prompt, then passages, then the
+    per-call task, so only the tail differs between agents and retries.
+    """
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": f"**Passages:**\n{context}"},
+        {"role": "user", "content": instructions}
+    ]
+
+
+def build_context_with_sources(documents: List[Document]) -> Tuple[List[str], List[Dict]]:
+    """Build one source-annotated context entry per document and extract the sources."""
+    context_parts = []
+    sources = []
+
+    for i, doc in enumerate(documents):
+        source = doc.metadata.get("source", "Unknown")
+        page = doc.metadata.get("page")
+
+        # Build source reference
+        if page:
+            source_ref = f"[Source {i+1}: {source}, Page {page}]"
+            sources.append({"index": i+1, "source": source, "page": page})
+        else:
+            source_ref = f"[Source {i+1}: {source}]"
+            sources.append({"index": i+1, "source": source, "page": None})
+
+        context_parts.append(f"{source_ref}\n{doc.page_content}")
+
+    return context_parts, sources
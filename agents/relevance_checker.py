@@ -1,73 +1,90 @@
-from openai import OpenAI
-from config.settings import settings
+from collections import OrderedDict
+from typing import List
+from langchain.schema import Document
+from ._client import create_chat_completion
+from .prompts import build_messages
+import hashlib
 import logging
+import string
 
 logger = logging.getLogger(__name__)
 
-client = OpenAI(api_key=settings.OPENAI_API_KEY)
+# Classification instructions, sent after the passages
+_RELEVANCE_TEMPLATE = string.Template("""
+Classify how well the passages above address the question. Reply with exactly one label:
+CAN_ANSWER (enough explicit information to fully answer), PARTIAL (the topic or timeframe
+is mentioned but details are missing), or NO_MATCH (the topic is not mentioned at all).
+
+**Question:** $question
+""")
+
+# Maximum number of (question, passages) verdicts kept in memory
+VERDICT_CACHE_SIZE = 512
 
 
 class RelevanceChecker:
     def __init__(self):
         # Initialize with OpenAI
         self.model_id = "gpt-5-mini"
-        self.max_tokens = 1000  # GPT-5 reasoning models need more tokens
-
-    def check(self, question: str, retriever, k=3) -> str:
+        # The verdict is a single label; minimal reasoning keeps the budget small
+        self.max_tokens = 32
+        self.reasoning_effort = "minimal"
+        self._verdict_cache = OrderedDict()  # LRU of (question, passages digest) -> label
+
+    def _cache_key(self, question: str, documents) -> tuple:
+        """Key a verdict by the normalized question and a digest of the passages."""
+        question_norm = " ".join(question.lower().split())
+        doc_key = hashlib.blake2b(
+            b"\x00".join(doc.page_content.encode() for doc in documents),
+            digest_size=16
+        ).digest()
+        return question_norm, doc_key
+
+    async def acheck(self, question: str, documents: List[Document], k=3) -> str:
         """
-        1. Retrieve the top-k document chunks from the global retriever.
+        1. Take the top-k chunks from the already-retrieved documents.
         2. Combine them into a single text string.
         3. Pass that text + question to the LLM for classification.
 
         Returns: "CAN_ANSWER", "PARTIAL", or "NO_MATCH".
         """
 
-        logger.debug(f"RelevanceChecker.check called with question='{question}' and k={k}")
+        logger.debug("RelevanceChecker.acheck called with question=%r and k=%s", question, k)
 
-        # Retrieve doc chunks from the ensemble retriever
-        top_docs = retriever.invoke(question)
+        top_docs = documents[:k]
         if not top_docs:
-            logger.debug("No documents returned from retriever.invoke(). Classifying as NO_MATCH.")
+            logger.debug("No documents retrieved for the question. Classifying as NO_MATCH.")
             return "NO_MATCH"
 
-        # Combine the top k chunk texts into one string
-        document_content = "\n\n".join(doc.page_content for doc in top_docs[:k])
-
-        # Create a prompt for the LLM to classify relevance
-        prompt = f"""
-        You are an AI relevance checker between a user's question and provided document content.
-
-        **Instructions:**
-        - Classify how well the document content addresses the user's question.
-        - Respond with only one of the following labels: CAN_ANSWER, PARTIAL, NO_MATCH.
-        - Do not include any additional text or explanation.
+        # Re-asking the same question over the same passages reuses the verdict
+        cache_key = self._cache_key(question, top_docs)
+        cached = self._verdict_cache.get(cache_key)
+        if cached is not None:
+            self._verdict_cache.move_to_end(cache_key)
+            logger.debug("Relevance verdict cache hit: %s", cached)
+            return cached
 
-        **Labels:**
-        1) "CAN_ANSWER": The passages contain enough explicit information to fully answer the question.
-        2) "PARTIAL": The passages mention or discuss the question's topic but do not provide all the details needed for a complete answer.
-        3) "NO_MATCH": The passages do not discuss or mention the question's topic at all.
-
-        **Important:** If the passages mention or reference the topic or timeframe of the question in any way, even if incomplete, respond with "PARTIAL" instead of "NO_MATCH".
+        # Combine the top k chunk texts into one string
+        document_content = "\n\n".join(doc.page_content for doc in top_docs)
 
-        **Question:** {question}
-        **Passages:** {document_content}
-
-        **Respond ONLY with one of the following labels: CAN_ANSWER, PARTIAL, NO_MATCH**
-        """
+        # Create a prompt for the LLM to classify relevance, passages first for prefix caching
+        messages = build_messages(document_content, _RELEVANCE_TEMPLATE.substitute(question=question))
 
         # Call the LLM
         try:
-            response = client.chat.completions.create(
+            response = await create_chat_completion(
                 model=self.model_id,
-                messages=[{"role": "user", "content": prompt}],
-                max_completion_tokens=self.max_tokens
+                messages=messages,
+                max_completion_tokens=self.max_tokens,
+                reasoning_effort=self.reasoning_effort
             )
-            llm_response = response.choices[0].message.content.strip().upper()
+            # Labels are matched by containment, so whitespace needs no stripping
+            llm_response = (response.choices[0].message.content or "").upper()
         except Exception as e:
-            print(f"[RelevanceChecker] Error during model inference: {e}")
+            logger.error("Error during relevance model inference: %s", e)
             return "NO_MATCH"
 
-        print(f"[RelevanceChecker] Raw response: '{llm_response}'")
+        logger.debug("Raw relevance response: %r", llm_response)
 
         # Parse response - check if any valid label is contained in the response
         if "CAN_ANSWER" in llm_response:
@@ -77,8 +94,13 @@ class RelevanceChecker:
         elif "NO_MATCH" in llm_response:
             classification = "NO_MATCH"
         else:
-            print(f"[RelevanceChecker] Could not parse response, defaulting to PARTIAL")
-            classification = "PARTIAL"  # Default to PARTIAL instead of NO_MATCH
+            # Often an empty reply after reasoning used up the token budget; don't cache it
+            logger.warning("Could not parse relevance response, defaulting to PARTIAL")
+            return "PARTIAL"  # Default to PARTIAL instead of NO_MATCH
+
+        logger.debug("Relevance classification: %s", classification)
 
-        print(f"[RelevanceChecker] Classification: {classification}")
+        self._verdict_cache[cache_key] = classification
+        if len(self._verdict_cache) > VERDICT_CACHE_SIZE:
+            self._verdict_cache.popitem(last=False)
         return classification
@@ -0,0 +1,113 @@
+import json
+from typing import Dict, List
+from langchain.schema import Document
+from ._client import create_chat_completion
+from .prompts import build_context_with_sources, build_messages
+import logging
+import string
+
+logger = logging.getLogger(__name__)
+
+# $strictness is only filled in on retries
+_UNIFIED_TEMPLATE = string.Template("""
+**Instructions:**
+- verdict: CAN_ANSWER if the passages fully answer the question, PARTIAL if the topic or timeframe is mentioned but details are missing, NO_MATCH if the topic is not mentioned at all.
+- answer: a clear, concise, factual answer using only the passages, citing sources as [Source X, Page Y]. Leave empty for NO_MATCH.
+- supported / unsupported_claims / contradictions / relevant / additional_details: verify your answer against the passages.
+$strictness
+**Question:** $question
+""")
+
+# Structured output schema covering relevance, answer and self-verification
+UNIFIED_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "unified_answer",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "verdict": {"type": "string", "enum": ["CAN_ANSWER", "PARTIAL", "NO_MATCH"]},
+                "answer": {"type": "string"},
+                "supported": {"type": "boolean"},
+                "unsupported_claims": {"type": "array", "items": {"type": "string"}},
+                "contradictions": {"type": "array", "items": {"type": "string"}},
+                "relevant": {"type": "boolean"},
+                "additional_details": {"type": "string"}
+            },
+            "required": [
+                "verdict", "answer", "supported", "unsupported_claims",
+                "contradictions", "relevant", "additional_details"
+            ],
+            "additionalProperties": False
+        }
+    }
+}
+
+
+class UnifiedAgent:
+    def __init__(self):
+        """
+        Initialize the unified agent, which classifies relevance, answers and
+        self-verifies in a single OpenAI call.
+        """
+        self.model_id = "gpt-5.2"
+        self.max_tokens = 6000  # Answer plus verification in one reasoning pass
+        logger.info("UnifiedAgent initialized with OpenAI %s.", self.model_id)
+
+    def generate_prompt(self, question: str, strict: bool = False) -> str:
+        """
+        Generate the task instructions asking for the relevance verdict, the answer and its verification at once.
+        """
+        strictness = (
+            "- A previous answer was not fully supported. Only state facts that appear verbatim or near-verbatim in the passages.\n"
+            if strict else ""
+        )
+        return _UNIFIED_TEMPLATE.substitute(strictness=strictness, question=question)
+
+    async def arun(self, question: str, documents: List[Document], strict: bool = False) -> Dict:
+        """
+        Classify, answer and verify the question against the provided documents.
+        """
+        logger.debug("UnifiedAgent.arun called with question=%r and %d documents.", question, len(documents))
+
+        context_parts, sources = build_context_with_sources(documents)
+        context = "\n\n".join(context_parts)
+        messages = build_messages(context, self.generate_prompt(question, strict=strict))
+
+        try:
+            response = await create_chat_completion(
+                model=self.model_id,
+                messages=messages,
+                max_completion_tokens=self.max_tokens,
+                response_format=UNIFIED_RESPONSE_FORMAT
+            )
+            data = json.loads(response.choices[0].message.content)
+        except Exception as e:
+            logger.error("Error during unified model inference: %s", e)
+            data = {
+                "verdict": "PARTIAL",
+                "answer": "",
+                "supported": False,
+                "unsupported_claims": [],
+                "contradictions": [],
+                "relevant": False,
+                "additional_details": f"Model error: {str(e)}"
+            }
+
+        draft_answer = data["answer"].strip() or "I cannot answer this question based on the provided documents."
+        logger.debug("Unified verdict: %s", data["verdict"])
+
+        return {
+            "classification": data["verdict"],
+            "draft_answer": draft_answer,
+            "sources": sources,
+            "verification": {
+                "Supported": "YES" if data["supported"] else "NO",
+                "Unsupported Claims": data["unsupported_claims"],
+                "Contradictions": data["contradictions"],
+                "Relevant": "YES" if data["relevant"] else "NO",
+                "Additional Details": data["additional_details"]
+            },
+            "context_used": context
+        }
@@ -1,9 +1,45 @@
-from openai import OpenAI
+import json
+import re
 from typing import Dict, List
-from langchain.schema import Document
-from config.settings import settings
-
-client = OpenAI(api_key=settings.OPENAI_API_KEY)
+from ._client import create_chat_completion
+from .prompts import build_messages
+import logging
+import string
+
+logger = logging.getLogger(__name__)
+
+# Matches the [Source N, Page M] / [Source N: file, Page M] citations in draft answers
+CITATION_PATTERN = re.compile(r"\[Source (\d+)")
+
+# Verification instructions, sent after the passages
+_VERIFICATION_TEMPLATE = string.Template("""
+Verify the answer against the passages above. Report whether it is factually supported
+(directly or indirectly), list any unsupported claims and contradictions, state whether
+it is relevant to the question, and add brief details where useful.
+
+**Answer:** $answer
+""")
+
+# Structured output schema the verifier must answer with
+VERIFICATION_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "verification",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "supported": {"type": "boolean"},
+                "unsupported_claims": {"type": "array", "items": {"type": "string"}},
+                "contradictions": {"type": "array", "items": {"type": "string"}},
+                "relevant": {"type": "boolean"},
+                "additional_details": {"type": "string"}
+            },
+            "required": ["supported", "unsupported_claims", "contradictions", "relevant", "additional_details"],
+            "additionalProperties": False
+        }
+    }
+}
 
 
 class VerificationAgent:
@@ -11,88 +47,31 @@ class VerificationAgent:
         """
         Initialize the verification agent with OpenAI.
         """
-        print("Initializing VerificationAgent with OpenAI gpt-5-mini...")
         self.model_id = "gpt-5-mini"
         self.max_tokens = 2000  # GPT-5 reasoning models need more tokens
-        print("VerificationAgent initialized successfully.")
-
-    def sanitize_response(self, response_text: str) -> str:
-        """
-        Sanitize the LLM's response by stripping unnecessary whitespace.
-        """
-        return response_text.strip()
+        logger.info("VerificationAgent initialized with OpenAI %s.", self.model_id)
 
-    def generate_prompt(self, answer: str, context: str) -> str:
-        """
-        Generate a structured prompt for the LLM to verify the answer against the context.
+    def generate_prompt(self, answer: str) -> str:
         """
-        prompt = f"""
-        You are an AI assistant designed to verify the accuracy and relevance of answers based on provided context.
-
-        **Instructions:**
-        - Verify the following answer against the provided context.
-        - Check for:
-        1. Direct/indirect factual support (YES/NO)
-        2. Unsupported claims (list any if present)
-        3. Contradictions (list any if present)
-        4. Relevance to the question (YES/NO)
-        - Provide additional details or explanations where relevant.
-        - Respond in the exact format specified below without adding any unrelated information.
-
-        **Format:**
-        Supported: YES/NO
-        Unsupported Claims: [item1, item2, ...]
-        Contradictions: [item1, item2, ...]
-        Relevant: YES/NO
-        Additional Details: [Any extra information or explanations]
-
-        **Answer:** {answer}
-        **Context:**
-        {context}
-
-        **Respond ONLY with the above format.**
+        Generate the task instructions asking the LLM to verify the answer against the passages.
         """
-        return prompt
+        return _VERIFICATION_TEMPLATE.substitute(answer=answer)
 
     def parse_verification_response(self, response_text: str) -> Dict:
         """
-        Parse the LLM's verification response into a structured dictionary.
+        Parse the LLM's JSON verification response into a structured dictionary.
         """
         try:
-            lines = response_text.split('\n')
-            verification = {}
-            for line in lines:
-                if ':' in line:
-                    key, value = line.split(':', 1)
-                    key = key.strip().capitalize()
-                    value = value.strip()
-                    if key in {"Supported", "Unsupported claims", "Contradictions", "Relevant", "Additional details"}:
-                        if key in {"Unsupported claims", "Contradictions"}:
-                            # Convert string list to actual list
-                            if value.startswith('[') and value.endswith(']'):
-                                items = value[1:-1].split(',')
-                                # Remove any surrounding quotes and whitespace
-                                items = [item.strip().strip('"').strip("'") for item in items if item.strip()]
-                                verification[key] = items
-                            else:
-                                verification[key] = []
-                        elif key == "Additional details":
-                            verification[key] = value
-                        else:
-                            verification[key] = value.upper()
-            # Ensure all keys are present
-            for key in ["Supported", "Unsupported Claims", "Contradictions", "Relevant", "Additional Details"]:
-                if key not in verification:
-                    if key in {"Unsupported Claims", "Contradictions"}:
-                        verification[key] = []
-                    elif key == "Additional Details":
-                        verification[key] = ""
-                    else:
-                        verification[key] = "NO"
-
-            return verification
-        except Exception as e:
-            print(f"Error parsing verification response: {e}")
+            data = json.loads(response_text)
+            return {
+                "Supported": "YES" if data["supported"] else "NO",
+                "Unsupported Claims": [str(item) for item in data.get("unsupported_claims", [])],
+                "Contradictions": [str(item) for item in data.get("contradictions", [])],
+                "Relevant": "YES" if data["relevant"] else "NO",
+                "Additional Details": data.get("additional_details", "")
+            }
+        except (ValueError, KeyError, TypeError) as e:
+            logger.error("Error parsing verification response: %s", e)
             return None
 
     def format_verification_report(self, verification: Dict) -> str:
@@ -125,33 +104,38 @@ class VerificationAgent:
 
         return report
 
-    def check(self, answer: str, documents: List[Document]) -> Dict:
+    def select_cited_context(self, answer: str, context_parts: List[str]) -> str:
         """
-        Verify the answer against the provided documents.
+        Keep only the context entries the answer cites, falling back to all of them
+        when no valid citation is found.
         """
-        print(f"VerificationAgent.check called with answer='{answer}' and {len(documents)} documents.")
+        cited = sorted({int(n) for n in CITATION_PATTERN.findall(answer)})
+        selected = [context_parts[n - 1] for n in cited if 0 < n <= len(context_parts)]
+        return "\n\n".join(selected or context_parts)
 
-        # Combine all document contents into one string without truncation
-        context = "\n\n".join([doc.page_content for doc in documents])
-        print(f"Combined context length: {len(context)} characters.")
+    async def acheck(self, answer: str, context_parts: List[str]) -> Dict:
+        """
+        Verify the answer against the source-annotated context entries it cites.
+        """
+        context = self.select_cited_context(answer, context_parts)
+        logger.debug("VerificationAgent.acheck called with answer=%r and %d characters of context.", answer, len(context))
 
-        # Create a prompt for the LLM to verify the answer
-        prompt = self.generate_prompt(answer, context)
-        print("Prompt created for the LLM.")
+        # Passages go before the answer so the prompt prefix is cacheable
+        messages = build_messages(context, self.generate_prompt(answer))
 
         # Call the LLM to generate the verification report
         try:
-            print("Sending prompt to the model...")
-            response = client.chat.completions.create(
+            response = await create_chat_completion(
                 model=self.model_id,
-                messages=[{"role": "user", "content": prompt}],
-                max_completion_tokens=self.max_tokens
+                messages=messages,
+                max_completion_tokens=self.max_tokens,
+                response_format=VERIFICATION_RESPONSE_FORMAT
             )
-            print("LLM response received.")
-            llm_response = response.choices[0].message.content.strip()
-            print(f"Raw LLM response:\n{llm_response}")
+            # Structured output is plain JSON, which json.loads parses with surrounding whitespace
+            llm_response = response.choices[0].message.content or ""
+            logger.debug("Raw LLM response:\n%s", llm_response)
         except Exception as e:
-            print(f"Error during model inference: {e}")
+            logger.error("Error during verification model inference: %s", e)
             verification_report = {
                 "Supported": "NO",
                 "Unsupported Claims": [],
@@ -162,13 +146,12 @@ class VerificationAgent:
             verification_report_formatted = self.format_verification_report(verification_report)
             return {
                 "verification_report": verification_report_formatted,
+                "verification": verification_report,
                 "context_used": context
             }
 
-        # Sanitize the response
-        sanitized_response = self.sanitize_response(llm_response) if llm_response else ""
-        if not sanitized_response:
-            print("LLM returned an empty response.")
+        if not llm_response:
+            logger.warning("LLM returned an empty verification response.")
             verification_report = {
                 "Supported": "NO",
                 "Unsupported Claims": [],
@@ -178,9 +161,9 @@ class VerificationAgent:
             }
         else:
             # Parse the response into the expected format
-            verification_report = self.parse_verification_response(sanitized_response)
+            verification_report = self.parse_verification_response(llm_response)
             if verification_report is None:
-                print("LLM did not respond with the expected format. Using default verification report.")
+                logger.warning("LLM did not respond with the expected format. Using default verification report.")
                 verification_report = {
                     "Supported": "NO",
                     "Unsupported Claims": [],
@@ -191,10 +174,10 @@ class VerificationAgent:
 
         # Format the verification report into a paragraph
         verification_report_formatted = self.format_verification_report(verification_report)
-        print(f"Verification report:\n{verification_report_formatted}")
-        print(f"Context used: {context}")
+        logger.debug("Verification report:\n%s", verification_report_formatted)
 
         return {
             "verification_report": verification_report_formatted,
+            "verification": verification_report,
             "context_used": context
         }
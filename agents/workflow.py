@@ -1,32 +1,46 @@
+import asyncio
 from langgraph.graph import StateGraph, END
 from typing import TypedDict, List, Dict
 from .research_agent import ResearchAgent
 from .verification_agent import VerificationAgent
 from .relevance_checker import RelevanceChecker
+from .unified_agent import UnifiedAgent
 from langchain.schema import Document
-from langchain.retrievers import EnsembleRetriever
+from langchain_core.retrievers import BaseRetriever
+from config.settings import settings
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Verification passes allowed per question (the first check plus one re-research)
+MAX_VERIFICATION_ROUNDS = 2
+
+NO_MATCH_ANSWER = "This question isn't related (or there's no data) for your query. Please ask another question relevant to the uploaded document(s)."
+
 class AgentState(TypedDict):
     question: str
     documents: List[Document]
+    context_parts: List[str]
     draft_answer: str
     verification_report: str
+    verification: Dict
+    retries: int
     sources: List[Dict]
     is_relevant: bool
-    retriever: EnsembleRetriever
 
 class AgentWorkflow:
     def __init__(self):
         self.researcher = ResearchAgent()
         self.verifier = VerificationAgent()
         self.relevance_checker = RelevanceChecker()
+        self.unified_agent = UnifiedAgent() if settings.UNIFIED_AGENT else None
         self.compiled_workflow = self.build_workflow()  # Compile once during initialization
         
     def build_workflow(self):
         """Create and compile the multi-agent workflow."""
+        if self.unified_agent is not None:
+            return self.build_unified_workflow()
+
         workflow = StateGraph(AgentState)
         
         # Add nodes
@@ -40,7 +54,7 @@ class AgentWorkflow:
             "check_relevance",
             self._decide_after_relevance_check,
             {
-                "relevant": "research",
+                "relevant": "verify",
                 "irrelevant": END
             }
         )
@@ -54,54 +68,106 @@ class AgentWorkflow:
             }
         )
         return workflow.compile()
+
+    def build_unified_workflow(self):
+        """Create and compile a single-node workflow backed by the unified agent."""
+        workflow = StateGraph(AgentState)
+        workflow.add_node("unified", self._unified_step)
+        workflow.set_entry_point("unified")
+        workflow.add_conditional_edges(
+            "unified",
+            self._decide_after_unified,
+            {
+                "re_research": "unified",
+                "end": END
+            }
+        )
+        return workflow.compile()
     
-    def _check_relevance_step(self, state: AgentState) -> Dict:
-        retriever = state["retriever"]
-        classification = self.relevance_checker.check(
-            question=state["question"], 
-            retriever=retriever, 
-            k=20
+    async def _check_relevance_step(self, state: AgentState) -> Dict:
+        # Draft the answer speculatively while the relevance check is in flight;
+        # the draft is discarded if the question turns out to be out of scope.
+        research_task = asyncio.create_task(
+            self.researcher.agenerate(state["question"], state["documents"])
         )
+        try:
+            classification = await self.relevance_checker.acheck(
+                question=state["question"],
+                documents=state["documents"],
+                k=5
+            )
+        except BaseException:
+            research_task.cancel()
+            raise
 
-        if classification == "CAN_ANSWER":
-            # We have enough info to proceed
-            return {"is_relevant": True}
-
-        elif classification == "PARTIAL":
-            # There's partial coverage, but we can still proceed
+        if classification == "NO_MATCH":
+            research_task.cancel()
             return {
-                "is_relevant": True
+                "is_relevant": False,
+                "draft_answer": NO_MATCH_ANSWER
             }
 
-        else:  # classification == "NO_MATCH"
+        # CAN_ANSWER or PARTIAL: there's enough coverage to proceed with the draft
+        result = await research_task
+        logger.debug("Researcher returned speculative draft answer.")
+        return {
+            "is_relevant": True,
+            "draft_answer": result["draft_answer"],
+            "context_parts": result["context_parts"],
+            "sources": result.get("sources", [])
+        }
+
+
+    async def _unified_step(self, state: AgentState) -> Dict:
+        logger.debug("Entered _unified_step with question=%r", state["question"])
+        # Retries re-ask with a stricter prompt after a failed self-verification
+        result = await self.unified_agent.arun(
+            state["question"], state["documents"], strict=state["retries"] > 0
+        )
+        if result["classification"] == "NO_MATCH":
             return {
                 "is_relevant": False,
-                "draft_answer": "This question isn't related (or there's no data) for your query. Please ask another question relevant to the uploaded document(s)."
+                "draft_answer": NO_MATCH_ANSWER
             }
 
+        return {
+            "is_relevant": True,
+            "draft_answer": result["draft_answer"],
+            "sources": result.get("sources", []),
+            "verification": result["verification"],
+            "verification_report": self.verifier.format_verification_report(result["verification"]),
+            "retries": state.get("retries", 0) + 1
+        }
+
+    def _decide_after_unified(self, state: AgentState) -> str:
+        if not state["is_relevant"]:
+            return "end"
+        return self._decide_next_step(state)
 
     def _decide_after_relevance_check(self, state: AgentState) -> str:
         decision = "relevant" if state["is_relevant"] else "irrelevant"
-        print(f"[DEBUG] _decide_after_relevance_check -> {decision}")
+        logger.debug("_decide_after_relevance_check -> %s", decision)
         return decision
     
-    def full_pipeline(self, question: str, retriever: EnsembleRetriever):
+    async def afull_pipeline(self, question: str, retriever: BaseRetriever):
         try:
-            print(f"[DEBUG] Starting full_pipeline with question='{question}'")
-            documents = retriever.invoke(question)
-            logger.info(f"Retrieved {len(documents)} relevant documents (from .invoke)")
+            logger.debug("Starting afull_pipeline with question=%r", question)
+            documents = await retriever.ainvoke(question)
+            logger.info("Retrieved %d relevant documents", len(documents))
 
             initial_state = AgentState(
                 question=question,
                 documents=documents,
+                context_parts=[],
                 draft_answer="",
                 verification_report="",
+                verification={},
+                retries=0,
                 sources=[],
-                is_relevant=False,
-                retriever=retriever
+                is_relevant=False
             )
 
-            final_state = self.compiled_workflow.invoke(initial_state)
+            final_state = await self.compiled_workflow.ainvoke(initial_state)
 
             return {
                 "draft_answer": final_state["draft_answer"],
@@ -109,30 +175,38 @@ class AgentWorkflow:
                 "sources": final_state.get("sources", [])
             }
         except Exception as e:
-            logger.error(f"Workflow execution failed: {e}")
+            logger.error("Workflow execution failed: %s", e)
             raise
     
-    def _research_step(self, state: AgentState) -> Dict:
-        print(f"[DEBUG] Entered _research_step with question='{state['question']}'")
-        result = self.researcher.generate(state["question"], state["documents"])
-        print("[DEBUG] Researcher returned draft answer.")
+    async def _research_step(self, state: AgentState) -> Dict:
+        logger.debug("Entered _research_step with question=%r", state["question"])
+        result = await self.researcher.agenerate(state["question"], state["documents"])
+        logger.debug("Researcher returned draft answer.")
         return {
             "draft_answer": result["draft_answer"],
+            "context_parts": result["context_parts"],
             "sources": result.get("sources", [])
         }
     
-    def _verification_step(self, state: AgentState) -> Dict:
-        print("[DEBUG] Entered _verification_step. Verifying the draft answer...")
-        result = self.verifier.check(state["draft_answer"], state["documents"])
-        print("[DEBUG] VerificationAgent returned a verification report.")
-        return {"verification_report": result["verification_report"]}
+    async def _verification_step(self, state: AgentState) -> Dict:
+        logger.debug("Entered _verification_step. Verifying the draft answer...")
+        result = await self.verifier.acheck(state["draft_answer"], state["context_parts"])
+        logger.debug("VerificationAgent returned a verification report.")
+        return {
+            "verification_report": result["verification_report"],
+            "verification": result["verification"],
+            "retries": state.get("retries", 0) + 1
+        }
     
     def _decide_next_step(self, state: AgentState) -> str:
-        verification_report = state["verification_report"]
-        print(f"[DEBUG] _decide_next_step with verification_report='{verification_report}'")
-        if "Supported: NO" in verification_report or "Relevant: NO" in verification_report:
-            logger.info("[DEBUG] Verification indicates re-research needed.")
+        verification = state["verification"]
+        logger.debug("_decide_next_step with verification=%s, retries=%d", verification, state["retries"])
+        if state["retries"] >= MAX_VERIFICATION_ROUNDS:
+            logger.info("Verification retry limit reached, ending workflow.")
+            return "end"
+        if verification.get("Supported") == "NO" or verification.get("Relevant") == "NO":
+            logger.info("Verification indicates re-research needed.")
             return "re_research"
         else:
-            logger.info("[DEBUG] Verification successful, ending workflow.")
+            logger.info("Verification successful, ending workflow.")
             return "end"
@@ -1,9 +1,12 @@
 import warnings
 warnings.filterwarnings("ignore", message="Could not load the custom kernel")
 
+import asyncio
 import gradio as gr
 import hashlib
 import markdown
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict
 import os
 
@@ -20,18 +23,52 @@ EXAMPLES = {
     }
 }
 
-processor = DocumentProcessor()
-retriever_builder = RetrieverBuilder()
-workflow = AgentWorkflow()
+# Number of built retrievers shared across sessions, keyed by uploaded file hashes
+RETRIEVER_CACHE_SIZE = 8
+
+# Built in main(): spawned document workers re-import this module as __mp_main__,
+# and must not construct the models, clients or UI themselves
+processor = None
+retriever_builder = None
+workflow = None
+retriever_cache = OrderedDict()
+markdown_renderer = markdown.Markdown()  # Reused across requests; reset() before each convert
+
+
+def _hash_file(path: str) -> str:
+    """Stream a file through SHA-256 without loading it into memory."""
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
 
 
 def _get_file_hashes(uploaded_files: List) -> frozenset:
     """Generate SHA-256 hashes for uploaded files."""
-    hashes = set()
-    for file in uploaded_files:
-        with open(file.name, "rb") as f:
-            hashes.add(hashlib.sha256(f.read()).hexdigest())
-    return frozenset(hashes)
+    if len(uploaded_files) == 1:
+        return frozenset([_hash_file(uploaded_files[0].name)])
+    # hashlib releases the GIL while digesting, so files hash in parallel
+    with ThreadPoolExecutor(max_workers=min(len(uploaded_files), 8)) as executor:
+        return frozenset(executor.map(_hash_file, (file.name for file in uploaded_files)))
+
+
+def _render_sources_html(source_keys: tuple) -> str:
+    """Render deduplicated (source, page) pairs as an HTML list."""
+    if not source_keys:
+        return "<div style='color: #94a3b8;'>No sources available</div>"
+
+    source_items = []
+    for source, page in dict.fromkeys(source_keys):
+        if page:
+            source_items.append(f"<li>{source} — Page {page}</li>")
+        else:
+            source_items.append(f"<li>{source}</li>")
+
+    return f"""
+            <div style="background: #1e293b; border-left: 4px solid #6366f1; padding: 16px; border-radius: 8px; line-height: 1.6; color: #c7d2fe;">
+                <ul style="margin: 0; padding-left: 20px;">
+                    {"".join(source_items)}
+                </ul>
+            </div>
+            """
 
 
 def load_example(example_key: str):
@@ -53,7 +90,7 @@ def load_example(example_key: str):
     return loaded_files, question
 
 
-def process_question(question_text: str, uploaded_files: List, state: Dict, progress=gr.Progress()):
+async def process_question(question_text: str, uploaded_files: List, state: Dict, progress=gr.Progress()):
     """Handle questions with document caching."""
     try:
         if not question_text.strip():
@@ -61,74 +98,71 @@ def process_question(question_text: str, uploaded_files: List, state: Dict, prog
         if not uploaded_files:
             raise ValueError("No documents uploaded")
 
-        current_hashes = _get_file_hashes(uploaded_files)
+        # Hashing, parsing and embedding block, so they run off the event loop
+        current_hashes = await asyncio.to_thread(_get_file_hashes, uploaded_files)
 
         if state["retriever"] is None or current_hashes != state["file_hashes"]:
-            progress(0.1, desc="Processing documents...")
-            chunks = processor.process(uploaded_files)
-
-            # Pass progress callback for detailed embedding updates
-            def embedding_progress(prog, desc):
-                progress(0.1 + prog * 0.5, desc=desc)
-
-            retriever = retriever_builder.build_hybrid_retriever(chunks, progress_callback=embedding_progress)
+            retriever = retriever_cache.get(current_hashes)
+            if retriever is not None:
+                # Another session already built a retriever for these exact files
+                retriever_cache.move_to_end(current_hashes)
+                logger.info("Reusing cached retriever for uploaded documents")
+            else:
+                progress(0.1, desc="Processing documents...")
+                chunks, failed_files = await asyncio.to_thread(processor.process, uploaded_files)
+
+                # Pass progress callback for detailed embedding updates
+                def embedding_progress(prog, desc):
+                    progress(0.1 + prog * 0.5, desc=desc)
+
+                retriever = await asyncio.to_thread(
+                    retriever_builder.build_hybrid_retriever, chunks, progress_callback=embedding_progress
+                )
+                if failed_files:
+                    # Chunks from the failed files are missing, so keep this retriever to the session
+                    logger.warning(f"Not caching retriever; failed to process: {', '.join(failed_files)}")
+                else:
+                    retriever_cache[current_hashes] = retriever
+                    if len(retriever_cache) > RETRIEVER_CACHE_SIZE:
+                        retriever_cache.popitem(last=False)
 
             state.update({
                 "file_hashes": current_hashes,
-                "retriever": retriever
+                "retriever": retriever,
+                "sources_html_cache": {}
             })
 
         progress(0.6, desc="Checking relevance...")
         progress(0.7, desc="Generating answer...")
-        result = workflow.full_pipeline(
+        result = await workflow.afull_pipeline(
             question=question_text,
             retriever=state["retriever"]
         )
         progress(0.9, desc="Finalizing...")
 
         # Convert markdown to HTML with styling (dark mode compatible)
-        answer_content = markdown.markdown(result["draft_answer"])
+        answer_content = markdown_renderer.reset().convert(result["draft_answer"])
         answer_html = f"""
         <div style="background: #1e3a5f; border-left: 4px solid #3b82f6; padding: 16px; border-radius: 8px; line-height: 1.6; color: #e2e8f0;">
             {answer_content}
         </div>
         """
 
-        verification_content = markdown.markdown(result["verification_report"].replace("\n", "<br>"))
+        verification_content = markdown_renderer.reset().convert(result["verification_report"].replace("\n", "<br>"))
         verification_html = f"""
         <div style="background: #14532d; border-left: 4px solid #22c55e; padding: 16px; border-radius: 8px; line-height: 1.8; color: #dcfce7;">
             {verification_content}
         </div>
         """
 
-        # Format sources
+        # Format sources, reusing the HTML when the same sources come back for this corpus
         sources = result.get("sources", [])
-        if sources:
-            # Deduplicate sources by (source, page)
-            seen = set()
-            unique_sources = []
-            for s in sources:
-                key = (s["source"], s["page"])
-                if key not in seen:
-                    seen.add(key)
-                    unique_sources.append(s)
-
-            source_items = []
-            for s in unique_sources:
-                if s["page"]:
-                    source_items.append(f"<li>{s['source']} — Page {s['page']}</li>")
-                else:
-                    source_items.append(f"<li>{s['source']}</li>")
-
-            sources_html = f"""
-            <div style="background: #1e293b; border-left: 4px solid #6366f1; padding: 16px; border-radius: 8px; line-height: 1.6; color: #c7d2fe;">
-                <ul style="margin: 0; padding-left: 20px;">
-                    {"".join(source_items)}
-                </ul>
-            </div>
-            """
-        else:
-            sources_html = "<div style='color: #94a3b8;'>No sources available</div>"
+        source_keys = tuple((s["source"], s["page"]) for s in sources)
+        sources_html_cache = state.setdefault("sources_html_cache", {})
+        sources_html = sources_html_cache.get(source_keys)
+        if sources_html is None:
+            sources_html = _render_sources_html(source_keys)
+            sources_html_cache[source_keys] = sources_html
 
         return answer_html, verification_html, sources_html, state
 
@@ -137,50 +171,68 @@ def process_question(question_text: str, uploaded_files: List, state: Dict, prog
         return f"Error: {str(e)}", "", "", state
 
 
-theme = gr.themes.Soft(
-    primary_hue="blue",
-    secondary_hue="indigo",
-    neutral_hue="slate",
-    font=gr.themes.GoogleFont("Inter"),
-)
-
-with gr.Blocks(theme=theme, title="DocChat") as demo:
-    session_state = gr.State({
-        "file_hashes": frozenset(),
-        "retriever": None
-    })
-
-    with gr.Row():
-        with gr.Column():
-            example_dropdown = gr.Dropdown(
-                label="Shelf",
-                choices=list(EXAMPLES.keys()),
-                value=None,
-            )
-            load_example_btn = gr.Button("Load Example")
-            files = gr.Files(label="Documents", file_types=constants.ALLOWED_TYPES)
-            question = gr.Textbox(label="Question", lines=3)
-            submit_btn = gr.Button("Submit", variant="primary")
-
-        with gr.Column():
-            gr.Markdown("**Answer**")
-            answer_output = gr.HTML()
-            gr.Markdown("**Sources**")
-            sources_output = gr.HTML()
-            gr.Markdown("**Verification Report**")
-            verification_output = gr.HTML()
-
-    load_example_btn.click(
-        fn=load_example,
-        inputs=[example_dropdown],
-        outputs=[files, question]
+def build_demo() -> gr.Blocks:
+    """Build the DocChat interface."""
+    theme = gr.themes.Soft(
+        primary_hue="blue",
+        secondary_hue="indigo",
+        neutral_hue="slate",
+        font=gr.themes.GoogleFont("Inter"),
     )
 
-    submit_btn.click(
-        fn=process_question,
-        inputs=[question, files, session_state],
-        outputs=[answer_output, verification_output, sources_output, session_state]
-    )
+    with gr.Blocks(theme=theme, title="DocChat") as demo:
+        session_state = gr.State({
+            "file_hashes": frozenset(),
+            "retriever": None,
+            "sources_html_cache": {}
+        })
+
+        with gr.Row():
+            with gr.Column():
+                example_dropdown = gr.Dropdown(
+                    label="Shelf",
+                    choices=list(EXAMPLES.keys()),
+                    value=None,
+                )
+                load_example_btn = gr.Button("Load Example")
+                files = gr.Files(label="Documents", file_types=constants.ALLOWED_TYPES)
+                question = gr.Textbox(label="Question", lines=3)
+                submit_btn = gr.Button("Submit", variant="primary")
+
+            with gr.Column():
+                gr.Markdown("**Answer**")
+                answer_output = gr.HTML()
+                gr.Markdown("**Sources**")
+                sources_output = gr.HTML()
+                gr.Markdown("**Verification Report**")
+                verification_output = gr.HTML()
+
+        load_example_btn.click(
+            fn=load_example,
+            inputs=[example_dropdown],
+            outputs=[files, question]
+        )
 
-if __name__ == "__main__":
+        submit_btn.click(
+            fn=process_question,
+            inputs=[question, files, session_state],
+            outputs=[answer_output, verification_output, sources_output, session_state]
+        )
+
+    return demo
+
+
+def main():
+    global processor, retriever_builder, workflow
+    processor = DocumentProcessor()
+    retriever_builder = RetrieverBuilder()
+    workflow = AgentWorkflow()
+
+    demo = build_demo()
+    # Let several async submits run at once instead of Gradio's default of one per event
+    demo.queue(default_concurrency_limit=16, max_size=64, api_open=False)
     demo.launch(server_name="127.0.0.1", server_port=5000, share=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -11,14 +11,16 @@ class Settings(BaseSettings):
     MAX_TOTAL_SIZE: int = MAX_TOTAL_SIZE
     ALLOWED_TYPES: list = ALLOWED_TYPES
 
-    # Database settings
-    CHROMA_DB_PATH: str = "./chroma_db"
-    CHROMA_COLLECTION_NAME: str = "documents"
-
     # Retrieval settings
     VECTOR_SEARCH_K: int = 10
     HYBRID_RETRIEVER_WEIGHTS: list = [0.4, 0.6]
 
+    # Document processing settings
+    DOCUMENT_PROCESSING_WORKERS: int = 4  # Docling worker processes kept for multi-file uploads
+
+    # Agent settings
+    UNIFIED_AGENT: bool = False  # Classify, answer and verify in a single LLM call
+
     # Logging settings
     LOG_LEVEL: str = "INFO"
 
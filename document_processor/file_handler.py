@@ -1,21 +1,40 @@
 import os
-import hashlib
-import pickle
+import sys
+import atexit
+import multiprocessing
+import threading
+import ahocorasick
+import pyarrow as pa
+import xxhash
+from pyarrow import feather
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import List
+from typing import Iterator, List, Optional, Tuple
+from docling.datamodel.base_models import InputFormat
 from docling.document_converter import DocumentConverter
-from langchain_text_splitters import MarkdownHeaderTextSplitter
+import re
 from langchain.schema import Document
 from config import constants
 from config.settings import settings
 from utils.logging import logger
 
+# Block size for streamed hashing reads
+IO_BLOCK_SIZE = 1 << 20
+# Rows per record batch in chunk caches; loads materialize one batch at a time
+CACHE_BATCH_ROWS = 1024
+
 class DocumentProcessor:
     def __init__(self):
         self.headers = [("#", "Header 1"), ("##", "Header 2")]
         self.cache_dir = Path(settings.CACHE_DIR)
         self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._converter = None  # Built on first use; loading Docling's models is slow
+        self._executor = None  # Worker pool, started on the first multi-file upload and kept
+        self._executor_lock = threading.Lock()
+        # Uploads are processed from several threads; Docling makes no thread-safety promise
+        self._converter_lock = threading.Lock()
         
     def validate_files(self, files: List) -> None:
         """Validate the total size of the uploaded files."""
@@ -23,55 +42,174 @@ class DocumentProcessor:
         if total_size > constants.MAX_TOTAL_SIZE:
             raise ValueError(f"Total size exceeds {constants.MAX_TOTAL_SIZE//1024//1024}MB limit")
 
-    def process(self, files: List) -> List:
-        """Process files with caching for subsequent queries"""
+    def process(self, files: List) -> Tuple[List, List[str]]:
+        """
+        Process files with caching for subsequent queries. Returns the unique
+        chunks and the paths of any files that failed and were skipped.
+        """
         self.validate_files(files)
-        all_chunks = []
-        seen_hashes = set()
-        
-        for file in files:
+        file_chunks = {}  # File index -> (fingerprints, chunks), merged back in upload order
+        misses = []  # (file index, path, cache path) for files without a valid cache
+
+        for index, file in enumerate(files):
             try:
                 # Generate content-based hash for caching
-                with open(file.name, "rb") as f:
-                    file_hash = self._generate_hash(f.read())
+                file_hash = self._hash_file(file.name)
                 
-                cache_path = self.cache_dir / f"{file_hash}.pkl"
+                cache_path = self.cache_dir / f"{file_hash}.arrow"
                 
-                if self._is_cache_valid(cache_path):
-                    logger.info(f"Loading from cache: {file.name}")
-                    chunks = self._load_from_cache(cache_path)
+                cached = self._load_from_cache(cache_path)
+                if cached is not None:
+                    logger.info(f"Loaded from cache: {file.name}")
+                    file_chunks[index] = cached
                 else:
-                    logger.info(f"Processing and caching: {file.name}")
-                    chunks = self._process_file(file)
-                    self._save_to_cache(chunks, cache_path)
-                
-                # Deduplicate chunks across files
-                for chunk in chunks:
-                    chunk_hash = self._generate_hash(chunk.page_content.encode())
-                    if chunk_hash not in seen_hashes:
-                        all_chunks.append(chunk)
-                        seen_hashes.add(chunk_hash)
+                    misses.append((index, file.name, cache_path))
                         
             except Exception as e:
                 logger.error(f"Failed to process {file.name}: {str(e)}")
                 continue
+
+        for (index, path, cache_path), (hashes, chunks) in self._process_misses(misses):
+            file_chunks[index] = (hashes, chunks)
+            try:
+                self._save_to_cache(chunks, hashes, cache_path)
+            except Exception as e:
+                logger.error(f"Failed to cache {path}: {str(e)}")
+
+        # Deduplicate chunks across files on their precomputed 64-bit fingerprints
+        all_chunks = []
+        seen_hashes: set[int] = set()
+        for index in sorted(file_chunks):
+            hashes, chunks = file_chunks[index]
+            for chunk_hash, chunk in zip(hashes, chunks):
+                if chunk_hash not in seen_hashes:
+                    all_chunks.append(chunk)
+                    seen_hashes.add(chunk_hash)
                 
+        failed = [file.name for index, file in enumerate(files) if index not in file_chunks]
         logger.info(f"Total unique chunks: {len(all_chunks)}")
-        return all_chunks
+        return all_chunks, failed
+
+    def _process_misses(self, misses: List) -> Iterator:
+        """
+        Convert uncached files. Yields (miss, (fingerprints, chunks)) for each
+        file that converted.
 
-    def _process_file(self, file) -> List:
-        """Process file with Docling and extract page metadata."""
-        if not file.name.endswith(('.pdf', '.docx', '.txt', '.md')):
-            logger.warning(f"Skipping unsupported file type: {file.name}")
-            return []
+        Files go to the worker pool once it exists, since its converters are
+        already warm. Until then, a single file or a batch that the warm
+        in-process converter can take is converted serially, which beats
+        paying for cold workers; a multi-file batch also starts the pool in
+        the background for the next upload. Only a multi-file batch with no
+        warm converter anywhere starts the pool and waits on it, because then
+        every path pays the model load and the pool at least pays it in parallel.
+        Uploads arriving while another converts in-process also go to the pool.
+        """
+        if not misses:
+            return
 
-        filename = os.path.basename(file.name)
-        converter = DocumentConverter()
-        result = converter.convert(file.name)
+        # A conversion already running in-process means concurrent uploads: use the pool instead of queueing
+        in_process_free = not self._converter_lock.locked()
+        if self._executor is None and in_process_free and (len(misses) == 1 or self._converter is not None):
+            yield from self._process_serially(misses)
+            if len(misses) > 1:
+                self._get_executor()
+            return
+
+        # A worker dying (OOM, a native crash) breaks the whole pool; retry the
+        # unfinished files once on a fresh pool rather than in this process,
+        # where the same crash would take the app down
+        remaining = misses
+        for _ in range(2):
+            executor = self._get_executor()
+            logger.info(f"Processing {len(remaining)} files on the worker pool")
+            remaining = yield from self._process_on_pool(executor, remaining)
+            if not remaining:
+                return
+            logger.warning("Document worker pool broke; discarding it")
+            self._discard_executor(executor)
+        for miss in remaining:
+            logger.error(f"Failed to process {miss[1]}: worker process died")
+
+    def _process_serially(self, misses: List) -> Iterator:
+        for miss in misses:
+            path = miss[1]
+            try:
+                logger.info(f"Processing and caching: {path}")
+                yield miss, self._process_file(path)
+            except Exception as e:
+                logger.error(f"Failed to process {path}: {str(e)}")
+
+    def _process_on_pool(self, executor: ProcessPoolExecutor, misses: List):
+        """
+        Yield results like `_process_misses`, then return the misses left
+        unfinished because the pool broke (empty if it didn't).
+        """
+        futures = {}
+        try:
+            for miss in misses:
+                futures[executor.submit(_process_file_in_worker, miss[1])] = miss
+        except BrokenProcessPool:
+            pass
+
+        unfinished = [miss for miss in misses if miss not in futures.values()]
+        for future in as_completed(futures):
+            miss = futures[future]
+            try:
+                yield miss, future.result()
+            except BrokenProcessPool:
+                unfinished.append(miss)
+            except Exception as e:
+                logger.error(f"Failed to process {miss[1]}: {str(e)}")
+        return unfinished
+
+    def _discard_executor(self, executor: ProcessPoolExecutor) -> None:
+        """Forget a broken pool so the next call starts a fresh one."""
+        with self._executor_lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """Start (once) the persistent pool of Docling worker processes."""
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = self._start_executor()
+        return self._executor
+
+    def _start_executor(self) -> ProcessPoolExecutor:
+        workers = settings.DOCUMENT_PROCESSING_WORKERS
+        logger.info(f"Starting {workers} document processing workers")
+        # Spawn rather than fork: Docling loads torch, which is not fork-safe
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker
+        )
+        # Workers spawn on demand; queue one no-op each so they all start warming up now
+        for _ in range(workers):
+            executor.submit(_warm_up_worker)
+        atexit.register(executor.shutdown, cancel_futures=True)
+        return executor
+
+    def _process_file(self, path: str) -> Tuple[List[int], List[Document]]:
+        """
+        Process file with Docling and extract page metadata. Returns the chunks
+        with their 64-bit content fingerprints, computed while each chunk's
+        text is at hand.
+        """
+        if not path.endswith(('.pdf', '.docx', '.txt', '.md')):
+            logger.warning(f"Skipping unsupported file type: {path}")
+            return [], []
+
+        filename = os.path.basename(path)
+        with self._converter_lock:
+            if self._converter is None:
+                self._converter = DocumentConverter()
+            result = self._converter.convert(path)
         doc = result.document
 
         # Build page mapping from document items
-        page_content_map = {}  # Maps content snippets to page numbers
+        page_content_map = {}  # Maps content snippets to the first page they appear on
         for item, _level in doc.iterate_items():
             if hasattr(item, 'prov') and item.prov:
                 for prov in item.prov:
@@ -79,23 +217,34 @@ class DocumentProcessor:
                         # Store first 100 chars as key for matching
                         snippet = item.text[:100] if item.text else ""
                         if snippet:
-                            page_content_map[snippet] = prov.page_no
+                            page_content_map.setdefault(snippet, prov.page_no)
+
+        # One automaton over all snippets finds matches in a single pass per chunk.
+        # Values carry each snippet's document order, since matches come back by end position.
+        automaton = None
+        if page_content_map:
+            automaton = ahocorasick.Automaton()
+            for order, (snippet, page) in enumerate(page_content_map.items()):
+                automaton.add_word(snippet, (order, page))
+            automaton.make_automaton()
 
         # Split markdown into chunks
         markdown = doc.export_to_markdown()
-        splitter = MarkdownHeaderTextSplitter(self.headers)
-        chunks = splitter.split_text(markdown)
+        chunks = _split_by_headers(markdown, {len(sep): name for sep, name in self.headers})
 
         # Add metadata to chunks
-        enriched_chunks = []
+        hashes, enriched_chunks = [], []
         for chunk in chunks:
-            # Try to find page number by matching content
+            content = chunk.page_content
+            chunk_hash = xxhash.xxh3_64_intdigest(content.encode())
+            hashes.append(chunk_hash)
+
+            # Take the page of the matched snippet that comes first in document order
             page_no = None
-            content_start = chunk.page_content[:100]
-            for snippet, page in page_content_map.items():
-                if snippet in chunk.page_content or content_start in snippet:
-                    page_no = page
-                    break
+            if automaton is not None:
+                first = min((value for _end_index, value in automaton.iter(content)), default=None)
+                if first is not None:
+                    page_no = first[1]
 
             metadata = {
                 "source": filename,
@@ -103,30 +252,181 @@ class DocumentProcessor:
                 **chunk.metadata
             }
             enriched_chunks.append(Document(
-                page_content=chunk.page_content,
+                id=_chunk_id(chunk_hash),
+                page_content=content,
                 metadata=metadata
             ))
 
-        return enriched_chunks
-
-    def _generate_hash(self, content: bytes) -> str:
-        return hashlib.sha256(content).hexdigest()
-
-    def _save_to_cache(self, chunks: List, cache_path: Path):
-        with open(cache_path, "wb") as f:
-            pickle.dump({
-                "timestamp": datetime.now().timestamp(),
-                "chunks": chunks
-            }, f)
-
-    def _load_from_cache(self, cache_path: Path) -> List:
-        with open(cache_path, "rb") as f:
-            data = pickle.load(f)
-        return data["chunks"]
-
-    def _is_cache_valid(self, cache_path: Path) -> bool:
-        if not cache_path.exists():
-            return False
-            
-        cache_age = datetime.now() - datetime.fromtimestamp(cache_path.stat().st_mtime)
-        return cache_age < timedelta(days=settings.CACHE_EXPIRE_DAYS)
\ No newline at end of file
+        return hashes, enriched_chunks
+
+    def _hash_file(self, path: str) -> str:
+        """Hash a file in 1 MiB blocks so memory stays bounded regardless of file size."""
+        h = xxhash.xxh3_128()
+        with open(path, "rb", buffering=IO_BLOCK_SIZE) as f:
+            for block in iter(lambda: f.read(IO_BLOCK_SIZE), b""):
+                h.update(block)
+        return h.hexdigest()
+
+    def _save_to_cache(self, chunks: List, hashes: List[int], cache_path: Path):
+        """
+        Store chunks as one columnar Arrow table: fingerprint, text, source,
+        page and one column per header level.
+        """
+        header_names = [name for _, name in self.headers]
+        table = pa.table({
+            "hash": pa.array(hashes, type=pa.uint64()),
+            "page_content": pa.array([c.page_content for c in chunks], type=pa.large_string()),
+            "source": pa.array([c.metadata.get("source") for c in chunks], type=pa.string()),
+            "page": pa.array([c.metadata.get("page") for c in chunks], type=pa.int64()),
+            **{
+                name: pa.array([c.metadata.get(name) for c in chunks], type=pa.string())
+                for name in header_names
+            }
+        })
+        # Uncompressed so loads can memory-map batches in place; compressed ones decompress onto the heap
+        feather.write_feather(table, cache_path, compression="uncompressed", chunksize=CACHE_BATCH_ROWS)
+
+    def _load_from_cache(self, cache_path: Path) -> Optional[Tuple[List[int], Iterator[Document]]]:
+        """
+        Read a cached Arrow table, returning its stored fingerprints and a
+        generator that rebuilds the Documents lazily, row by row. Returns
+        None when there is no cache or it has expired.
+        """
+        # One stat answers both "does it exist" and "is it fresh"
+        try:
+            cache_stat = cache_path.stat()
+        except FileNotFoundError:
+            return None
+        cache_age = datetime.now() - datetime.fromtimestamp(cache_stat.st_mtime)
+        if cache_age >= timedelta(days=settings.CACHE_EXPIRE_DAYS):
+            return None
+
+        table = feather.read_table(cache_path, memory_map=True)
+        header_names = [name for _, name in self.headers]
+
+        def documents():
+            # Only one record batch at a time is turned into Python objects;
+            # the rest of the table stays in the memory-mapped file
+            for batch in table.to_batches():
+                columns = batch.to_pydict()
+                for i, page_content in enumerate(columns["page_content"]):
+                    metadata = {"source": columns["source"][i], "page": columns["page"][i]}
+                    for name in header_names:
+                        value = columns[name][i]
+                        if value is not None:
+                            metadata[name] = value
+                    yield Document(id=_chunk_id(columns["hash"][i]), page_content=page_content, metadata=metadata)
+
+        # Fingerprints are needed up front for dedup, and are only 8 bytes per chunk
+        return table.column("hash").to_pylist(), documents()
+
+
+def _chunk_id(chunk_hash: int) -> str:
+    """Document id carrying the chunk's fingerprint, so the retriever can key on it without rehashing."""
+    return f"{chunk_hash:016x}"
+
+
+# One scan finds the h1/h2 headers to split on, skipping fenced code blocks
+# (an unclosed fence runs to the end) so "#" comments inside them are not headers
+_HEADER_PATTERN = re.compile(
+    r"^[ \t]*(?:"
+    r"(?P<fence>```(?![^\n]*```)|~~~)[\s\S]*?(?:\n[ \t]*(?P=fence)[^\n]*|\Z)"
+    r"|(?P<level>#{1,2})(?: +(?P<title>[^\n]*?))?[ \t]*$"
+    r")",
+    re.MULTILINE
+)
+
+
+def _clean_line(line: str) -> str:
+    """Strip a line and drop its non-printable characters, as LangChain's splitter does."""
+    line = line.strip()
+    return line if line.isprintable() else "".join(filter(str.isprintable, line))
+
+
+def _split_by_headers(markdown: str, header_names: dict) -> List[Document]:
+    """
+    Split markdown into one Document per header section, with the enclosing
+    headers (keyed by level in `header_names`) as metadata.
+
+    Follows MarkdownHeaderTextSplitter's output: lines are stripped and
+    cleared of non-printable characters (tabs, NBSP, zero-width spaces),
+    lines within a paragraph join with "\n", paragraphs join with "  \n",
+    header lines are dropped, and consecutive sections with the same headers
+    merge. One difference: a header or fence marker preceded by a non-printable
+    character other than whitespace is treated as text here.
+    """
+    chunks = []
+    headers = {}  # Level -> title of the header currently in scope
+    paragraphs, lines = [], []
+
+    def add_text(text):
+        nonlocal lines
+        if not text:
+            return
+        # `text` is whole lines; a trailing newline ends the last one rather than adding a blank
+        if text.endswith("\n"):
+            text = text[:-1]
+        for line in text.split("\n"):
+            line = _clean_line(line)
+            if line:
+                lines.append(line)
+            elif lines:
+                paragraphs.append("\n".join(lines))
+                lines = []
+
+    def flush_section():
+        nonlocal lines
+        if lines:
+            paragraphs.append("\n".join(lines))
+            lines = []
+        if not paragraphs:
+            return
+        metadata = {header_names[level]: title for level, title in sorted(headers.items())}
+        content = "  \n".join(paragraphs)
+        paragraphs.clear()
+        if chunks and chunks[-1].metadata == metadata:
+            chunks[-1].page_content += "  \n" + content
+        else:
+            chunks.append(Document(page_content=content, metadata=metadata))
+
+    position = 0
+    for match in _HEADER_PATTERN.finditer(markdown):
+        add_text(markdown[position:match.start()])
+        if match.group("fence"):
+            # Code lines, blank ones included, stay in the current paragraph
+            lines.extend(_clean_line(line) for line in match.group(0).split("\n"))
+        else:
+            flush_section()
+            level = len(match.group("level"))
+            for deeper in [l for l in headers if l >= level]:
+                del headers[deeper]
+            headers[level] = _clean_line(match.group("title") or "").strip()
+        # Resume after the matched line's own newline
+        position = match.end() + markdown.startswith("\n", match.end())
+    add_text(markdown[position:])
+    flush_section()
+    return chunks
+
+
+# Per-process state for DocumentProcessor pool workers
+_worker_processor = None
+
+
+def _init_worker():
+    global _worker_processor
+    # Leave app.log to the parent: several processes rotating one file race each other
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+    _worker_processor = DocumentProcessor()
+    # DocumentConverter() loads nothing until its first convert(); build the PDF
+    # pipeline and its models now so the pool's first upload finds them warm
+    _worker_processor._converter = DocumentConverter()
+    _worker_processor._converter.initialize_pipeline(InputFormat.PDF)
+
+
+def _warm_up_worker():
+    pass
+
+
+def _process_file_in_worker(path: str) -> Tuple[List[int], List[Document]]:
+    return _worker_processor._process_file(path)
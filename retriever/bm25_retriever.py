@@ -0,0 +1,53 @@
+from typing import Any, List, Tuple
+import bm25s
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class BM25sRetriever(BaseRetriever):
+    """
+    Keyword retriever backed by a bm25s index.
+
+    bm25s scores queries against a precomputed sparse matrix instead of
+    looping over every document in Python, and its index can be saved and
+    reloaded without retokenizing the corpus.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    index: Any
+    docs: List[Document]
+    k: int = 4
+
+    @classmethod
+    def from_documents(cls, docs: List[Document], **kwargs) -> "BM25sRetriever":
+        """Tokenize and index the documents."""
+        index = bm25s.BM25()
+        index.index(bm25s.tokenize([doc.page_content for doc in docs], show_progress=False), show_progress=False)
+        return cls(index=index, docs=docs, **kwargs)
+
+    @classmethod
+    def load(cls, path: str, docs: List[Document], **kwargs) -> "BM25sRetriever":
+        """Load an index saved with `save`; `docs` must be the documents it was built from, in order."""
+        return cls(index=bm25s.BM25.load(path), docs=docs, **kwargs)
+
+    def save(self, path: str) -> None:
+        self.index.save(path)
+
+    def search_with_scores(self, query: str) -> List[Tuple[Document, float]]:
+        """Return the top `k` documents for the query with their BM25 scores."""
+        query_tokens = bm25s.tokenize(query, return_ids=False, show_progress=False)
+        if not query_tokens[0]:
+            return []
+        indices, scores = self.index.retrieve(query_tokens, k=min(self.k, len(self.docs)), show_progress=False)
+        return [(self.docs[i], float(score)) for i, score in zip(indices[0], scores[0])]
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return [doc for doc, _ in self.search_with_scores(query)]
@@ -1,32 +1,138 @@
-from langchain_community.vectorstores import Chroma
 from langchain_openai import OpenAIEmbeddings
-from langchain_community.retrievers import BM25Retriever
-from langchain.retrievers import EnsembleRetriever
+from openai import OpenAI
 from config.settings import settings
-import hashlib
+from .bm25_retriever import BM25sRetriever
+from .embedding_cache import EmbeddingCache
+from .faiss_store import FaissVectorStore
+from .hybrid_retriever import HybridRetriever
+from concurrent.futures import ThreadPoolExecutor
 import os
+import numpy as np
+import tiktoken
+import xxhash
 import logging
 
 logger = logging.getLogger(__name__)
 
-# Batch size for embedding (stay well under 300k token limit)
-EMBEDDING_BATCH_SIZE = 500
+EMBEDDING_MODEL = "text-embedding-3-small"
+# Embedding request limits: pack each batch under the 300k tokens/request cap
+# (with headroom) and OpenAI's 2048 inputs/request
+MAX_TOKENS_PER_BATCH = 250_000
+MAX_INPUTS_PER_BATCH = 2048
+# Model context length; longer chunks are embedded in pieces of at most this many tokens
+MAX_TOKENS_PER_INPUT = 8191
+# Concurrent embedding requests in flight while building a vector store
+EMBEDDING_WORKERS = 8
 VECTOR_STORE_DIR = "vector_cache"
+# Per-chunk embeddings shared by every vector store under VECTOR_STORE_DIR
+EMBEDDING_CACHE_FILE = "embeddings.sqlite3"
 
 
 class RetrieverBuilder:
     def __init__(self):
         """Initialize the retriever builder with OpenAI embeddings."""
         self.embeddings = OpenAIEmbeddings(
-            model="text-embedding-3-small",
+            model=EMBEDDING_MODEL,
             openai_api_key=settings.OPENAI_API_KEY
         )
+        # Documents are embedded through the raw client from pre-tokenized batches;
+        # OpenAIEmbeddings would tokenize every chunk a second time
+        self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
+        self.encoding = tiktoken.encoding_for_model(EMBEDDING_MODEL)
         os.makedirs(VECTOR_STORE_DIR, exist_ok=True)
+        self.embedding_cache = EmbeddingCache(os.path.join(VECTOR_STORE_DIR, EMBEDDING_CACHE_FILE), EMBEDDING_MODEL)
 
     def _get_docs_hash(self, docs) -> str:
-        """Generate hash from document contents for cache key."""
-        content = "".join(doc.page_content for doc in docs)
-        return hashlib.sha256(content.encode()).hexdigest()[:16]
+        """Generate hash from document fingerprints and locations for cache key."""
+        h = xxhash.xxh3_128()
+        for doc in docs:
+            # NUL-separate fields so values can't shift across chunk boundaries unnoticed
+            h.update(f"{self._chunk_key(doc)}\x00{doc.metadata.get('source')}\x00{doc.metadata.get('page')}\x00".encode())
+        return h.hexdigest()
+
+    def _token_batches(self, items):
+        """
+        Tokenize (hash, document) pairs once and greedily pack the token lists
+        into batches under the per-request token and input limits. Chunks
+        longer than the model's context are split into context-sized pieces
+        first, so no single input or request can exceed a limit. Each batch
+        entry is a (hash, tokens) piece.
+        """
+        token_lists = self.encoding.encode_ordinary_batch([doc.page_content for _, doc in items])
+        batches, batch, batch_tokens = [], [], 0
+        for (chunk_hash, _), tokens in zip(items, token_lists):
+            for start in range(0, len(tokens), MAX_TOKENS_PER_INPUT):
+                piece = tokens[start:start + MAX_TOKENS_PER_INPUT]
+                if batch and (batch_tokens + len(piece) > MAX_TOKENS_PER_BATCH or len(batch) >= MAX_INPUTS_PER_BATCH):
+                    batches.append(batch)
+                    batch, batch_tokens = [], 0
+                batch.append((chunk_hash, piece))
+                batch_tokens += len(piece)
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _embed_batch(self, batch):
+        """Embed one packed batch, sending the already-counted token ids instead of text."""
+        response = self.client.embeddings.create(model=EMBEDDING_MODEL, input=[tokens for _, tokens in batch])
+        return [item.embedding for item in response.data]
+
+    def _chunk_key(self, doc) -> str:
+        """
+        The chunk's content fingerprint: the xxh3_64 id DocumentProcessor
+        already assigned, hashed here only for documents from elsewhere.
+        """
+        return doc.id or xxhash.xxh3_64_hexdigest(doc.page_content.encode())
+
+    def _unique_by_hash(self, docs):
+        """Map each distinct chunk's content fingerprint to its first document, in order."""
+        by_hash = {}
+        for doc in docs:
+            by_hash.setdefault(self._chunk_key(doc), doc)
+        return by_hash
+
+    def _embed_documents(self, by_hash, progress_callback=None):
+        """
+        Return a float32 matrix with one row per document in `by_hash`, reusing cached per-chunk
+        embeddings and embedding only the chunks never seen before, in
+        concurrent batches.
+        """
+        vectors = self.embedding_cache.get_many(by_hash)
+        logger.info(f"Reused {len(vectors)} cached chunk embeddings.")
+
+        missing = [(h, doc) for h, doc in by_hash.items() if h not in vectors]
+        if missing:
+            batches = self._token_batches(missing)
+            total_batches = len(batches)
+            logger.info(f"Embedding {len(missing)} documents in {total_batches} batches...")
+
+            if progress_callback:
+                progress_callback(0.2, f"Embedding {total_batches} batches...")
+
+            # Embedding calls are latency-bound, so overlap the round-trips in threads
+            with ThreadPoolExecutor(max_workers=EMBEDDING_WORKERS) as executor:
+                results = executor.map(self._embed_batch, batches)
+                pieces = {}  # Hash -> [(piece vector, piece token count)]
+                for batch_num, (batch, embeddings) in enumerate(zip(batches, results), start=1):
+                    for (chunk_hash, tokens), embedding in zip(batch, embeddings):
+                        pieces.setdefault(chunk_hash, []).append((embedding, len(tokens)))
+                    logger.info(f"Embedded batch {batch_num}/{total_batches}")
+                    if progress_callback:
+                        prog = 0.2 + (0.5 * batch_num / total_batches)
+                        progress_callback(prog, f"Embedding batch {batch_num}/{total_batches}...")
+
+            # A split chunk's vector is its pieces' token-weighted mean, renormalized
+            embedded = {}
+            for chunk_hash, chunk_pieces in pieces.items():
+                if len(chunk_pieces) == 1:
+                    embedded[chunk_hash] = np.asarray(chunk_pieces[0][0], dtype=np.float32)
+                else:
+                    mean = np.average([v for v, _ in chunk_pieces], axis=0, weights=[n for _, n in chunk_pieces])
+                    embedded[chunk_hash] = (mean / np.linalg.norm(mean)).astype(np.float32)
+            self.embedding_cache.put_many(embedded, embedded.values())
+            vectors.update(embedded)
+
+        return np.stack([vectors[h] for h in by_hash])
 
     def build_hybrid_retriever(self, docs, progress_callback=None):
         """Build a hybrid retriever using BM25 and vector-based retrieval."""
@@ -34,53 +140,40 @@ class RetrieverBuilder:
             docs_hash = self._get_docs_hash(docs)
             persist_path = os.path.join(VECTOR_STORE_DIR, docs_hash)
 
-            # Check if cached vector store exists
-            if os.path.exists(persist_path):
-                logger.info(f"Loading cached vector store from {persist_path}")
+            # FAISS ids are positions among the distinct chunks, rebuilt identically on reload
+            by_hash = self._unique_by_hash(docs)
+            unique_docs = list(by_hash.values())
+
+            # Check if cached vector index exists
+            if FaissVectorStore.is_saved(persist_path):
+                logger.info(f"Loading cached vector index from {persist_path}")
                 if progress_callback:
                     progress_callback(0.5, "Loading cached embeddings...")
-                vector_store = Chroma(
-                    persist_directory=persist_path,
-                    embedding_function=self.embeddings
-                )
+                vector_store = FaissVectorStore.load(persist_path, unique_docs, self.embeddings)
             else:
-                # Create new vector store in batches
-                total_batches = (len(docs) - 1) // EMBEDDING_BATCH_SIZE + 1
-                logger.info(f"Embedding {len(docs)} documents in {total_batches} batches...")
-
-                if progress_callback:
-                    progress_callback(0.2, f"Embedding batch 1/{total_batches}...")
-
-                vector_store = Chroma.from_documents(
-                    documents=docs[:EMBEDDING_BATCH_SIZE],
-                    embedding=self.embeddings,
-                    persist_directory=persist_path
-                )
-
-                for i in range(EMBEDDING_BATCH_SIZE, len(docs), EMBEDDING_BATCH_SIZE):
-                    batch_num = i // EMBEDDING_BATCH_SIZE + 1
-                    if progress_callback:
-                        prog = 0.2 + (0.5 * batch_num / total_batches)
-                        progress_callback(prog, f"Embedding batch {batch_num}/{total_batches}...")
-
-                    batch = docs[i:i + EMBEDDING_BATCH_SIZE]
-                    vector_store.add_documents(batch)
-                    logger.info(f"Embedded batch {batch_num}/{total_batches}")
+                vectors = self._embed_documents(by_hash, progress_callback)
+                vector_store = FaissVectorStore.from_embeddings(unique_docs, vectors, self.embeddings)
+                os.makedirs(persist_path, exist_ok=True)
+                vector_store.save(persist_path)
 
             logger.info("Vector store ready.")
             
-            # Create BM25 retriever
-            bm25 = BM25Retriever.from_documents(docs)
-            logger.info("BM25 retriever created successfully.")
-            
-            # Create vector-based retriever
-            vector_retriever = vector_store.as_retriever(search_kwargs={"k": settings.VECTOR_SEARCH_K})
-            logger.info("Vector retriever created successfully.")
+            # Create BM25 retriever, reusing the bm25s index persisted next to the vectors
+            bm25_path = os.path.join(persist_path, "bm25")
+            if os.path.isdir(bm25_path):
+                bm25 = BM25sRetriever.load(bm25_path, docs)
+                logger.info("BM25 retriever loaded from cache.")
+            else:
+                bm25 = BM25sRetriever.from_documents(docs)
+                bm25.save(bm25_path)
+                logger.info("BM25 retriever created successfully.")
             
-            # Combine retrievers into a hybrid retriever
-            hybrid_retriever = EnsembleRetriever(
-                retrievers=[bm25, vector_retriever],
-                weights=settings.HYBRID_RETRIEVER_WEIGHTS
+            # Fuse keyword and vector scores in one retriever that runs both searches concurrently
+            hybrid_retriever = HybridRetriever(
+                bm25=bm25,
+                vector_store=vector_store,
+                weights=settings.HYBRID_RETRIEVER_WEIGHTS,
+                vector_k=settings.VECTOR_SEARCH_K
             )
             logger.info("Hybrid retriever created successfully.")
             return hybrid_retriever
@@ -0,0 +1,61 @@
+import sqlite3
+import threading
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+# SQLite caps bound parameters per statement; stay under it when looking up keys
+_LOOKUP_BATCH_SIZE = 900
+
+
+class EmbeddingCache:
+    """
+    Persistent per-chunk embedding cache backed by SQLite.
+
+    Vectors are keyed by (model, chunk content hash) and stored as float32
+    BLOBs, so a chunk is only ever embedded once per model no matter which
+    document set it shows up in.
+    """
+
+    def __init__(self, path: str, model: str):
+        self.model = model
+        self._lock = threading.Lock()
+        # Shared across the threads that build retrievers; access is serialized by the lock
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, hash TEXT NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (model, hash))"
+            )
+
+    def get_many(self, hashes):
+        """Return a {hash: float32 vector} dict for every hash that is cached."""
+        found = {}
+        hashes = list(hashes)
+        with self._lock:
+            for i in range(0, len(hashes), _LOOKUP_BATCH_SIZE):
+                batch = hashes[i:i + _LOOKUP_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({placeholders})",
+                    [self.model, *batch]
+                )
+                for chunk_hash, blob in rows:
+                    found[chunk_hash] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, hashes, vectors):
+        """Store vectors for the given hashes, replacing any existing entries."""
+        rows = [
+            (self.model, chunk_hash, np.asarray(vector, dtype=np.float32).tobytes())
+            for chunk_hash, vector in zip(hashes, vectors)
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, vector) VALUES (?, ?, ?)",
+                rows
+            )
+        logger.debug(f"Cached {len(rows)} embeddings")
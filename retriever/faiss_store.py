@@ -0,0 +1,85 @@
+from typing import List, Tuple
+import asyncio
+import os
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+import logging
+
+logger = logging.getLogger(__name__)
+
+# HNSW graph parameters: neighbours per node, build-time and query-time beam widths.
+# The query beam must cover every candidate handed to the re-rank stage.
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 256
+# Candidates pulled from the int8 index and re-scored against float32 vectors
+RERANK_CANDIDATES = 200
+INDEX_FILE = "index.faiss"
+VECTORS_FILE = "vectors.npy"
+
+
+class FaissVectorStore:
+    """
+    Two-stage nearest-neighbour search over chunk embeddings: an HNSW graph
+    over 8-bit scalar-quantized vectors finds candidates at a quarter of the
+    float32 memory traffic, then the candidates are re-ranked exactly against
+    the full-precision vectors, which stay memory-mapped on disk.
+
+    Vectors are compared by inner product, which is cosine similarity for
+    OpenAI's unit-length embeddings. FAISS ids are positions in `docs`, so
+    only the index and vectors are persisted and the documents come from the caller.
+    """
+
+    def __init__(self, index, vectors: np.ndarray, docs: List[Document], embeddings):
+        self.index = index
+        self.index.hnsw.efSearch = HNSW_EF_SEARCH
+        self.vectors = vectors
+        self.docs = docs
+        self.embeddings = embeddings
+
+    @classmethod
+    def from_embeddings(cls, docs: List[Document], vectors, embeddings) -> "FaissVectorStore":
+        """Build an int8 HNSW index over `vectors`, one per document in `docs`."""
+        matrix = np.asarray(vectors, dtype=np.float32)
+        index = faiss.IndexHNSWSQ(matrix.shape[1], faiss.ScalarQuantizer.QT_8bit, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index.train(matrix)  # Learns the per-dimension ranges the quantizer maps to 8 bits
+        index.add(matrix)
+        logger.info(f"Built FAISS int8 HNSW index over {index.ntotal} vectors.")
+        return cls(index, matrix, docs, embeddings)
+
+    @classmethod
+    def load(cls, path: str, docs: List[Document], embeddings) -> "FaissVectorStore":
+        """Load an index saved with `save`; `docs` must be the documents it was built from, in order."""
+        return cls(
+            faiss.read_index(f"{path}/{INDEX_FILE}"),
+            np.load(f"{path}/{VECTORS_FILE}", mmap_mode="r"),
+            docs,
+            embeddings
+        )
+
+    @staticmethod
+    def is_saved(path: str) -> bool:
+        return all(os.path.exists(f"{path}/{name}") for name in (INDEX_FILE, VECTORS_FILE))
+
+    def save(self, path: str) -> None:
+        faiss.write_index(self.index, f"{path}/{INDEX_FILE}")
+        np.save(f"{path}/{VECTORS_FILE}", self.vectors)
+
+    def _search(self, query_vector: List[float], k: int) -> List[Tuple[Document, float]]:
+        query = np.asarray(query_vector, dtype=np.float32)
+        _, ids = self.index.search(query[None, :], max(k, RERANK_CANDIDATES))
+        # FAISS pads with id -1 when fewer candidates are reachable
+        candidates = ids[0][ids[0] != -1]
+        scores = self.vectors[candidates] @ query
+        top = np.argsort(-scores)[:k]
+        return [(self.docs[candidates[i]], float(scores[i])) for i in top]
+
+    def similarity_search_with_relevance_scores(self, query: str, k: int = 4) -> List[Tuple[Document, float]]:
+        """Return the `k` nearest documents with their cosine similarity to the query."""
+        return self._search(self.embeddings.embed_query(query), k)
+
+    async def asimilarity_search_with_relevance_scores(self, query: str, k: int = 4) -> List[Tuple[Document, float]]:
+        query_vector = await self.embeddings.aembed_query(query)
+        return await asyncio.to_thread(self._search, query_vector, k)
@@ -0,0 +1,61 @@
+from typing import Any, Dict, List, Tuple
+import asyncio
+import heapq
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict
+from .bm25_retriever import BM25sRetriever
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Keyword + vector retriever that fuses both result lists on their scores.
+
+    BM25 scores are scaled by the query's best BM25 score and vector hits use
+    the store's [0, 1] relevance score, so `weights` blend comparable values.
+    Documents found by both searches, matched on content, add up their scores.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    bm25: BM25sRetriever
+    vector_store: Any
+    weights: List[float]
+    vector_k: int = 10
+
+    def _fuse(
+        self,
+        keyword_hits: List[Tuple[Document, float]],
+        vector_hits: List[Tuple[Document, float]]
+    ) -> List[Document]:
+        bm25_weight, vector_weight = self.weights
+        top_bm25 = max((score for _, score in keyword_hits), default=0.0) or 1.0
+
+        fused: Dict[str, Tuple[float, Document]] = {}
+        for doc, score in keyword_hits:
+            fused[doc.page_content] = (bm25_weight * score / top_bm25, doc)
+        for doc, score in vector_hits:
+            previous, previous_doc = fused.get(doc.page_content, (0.0, doc))
+            fused[doc.page_content] = (previous + vector_weight * score, previous_doc)
+
+        top = heapq.nlargest(self.bm25.k + self.vector_k, fused.values(), key=lambda item: item[0])
+        return [doc for _, doc in top]
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return self._fuse(
+            self.bm25.search_with_scores(query),
+            self.vector_store.similarity_search_with_relevance_scores(query, k=self.vector_k)
+        )
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        # BM25 is CPU-bound and the vector search waits on the embeddings API; overlap them
+        keyword_hits, vector_hits = await asyncio.gather(
+            asyncio.to_thread(self.bm25.search_with_scores, query),
+            self.vector_store.asimilarity_search_with_relevance_scores(query, k=self.vector_k)
+        )
+        return self._fuse(keyword_hits, vector_hits)